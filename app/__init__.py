@@ -10,6 +10,8 @@ from flask_cors import CORS
 from celery import Celery
 import psycopg2
 from psycopg2 import OperationalError
+# Imported at module load so its Celery logging signal is connected before a worker starts
+from app.config.logger import setup_async_logging
 
 # Initialize extensions
 db = SQLAlchemy()
@@ -28,7 +30,8 @@ def wait_for_database(max_retries=30, retry_interval=2):
                 port=os.getenv('POSTGRES_PORT', '5432'),
                 database=os.getenv('POSTGRES_DB', 'ai_rate_limiter'),
                 user=os.getenv('POSTGRES_USER', 'postgres'),
-                password=os.getenv('POSTGRES_PASSWORD', 'postgres')
+                password=os.getenv('POSTGRES_PASSWORD', 'postgres'),
+                connect_timeout=int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
             )
             conn.close()
             print("✅ Database is ready!")
@@ -48,6 +51,9 @@ def create_app():
     # Load configuration
     app.config.from_object('app.config.config.Config')
     
+    # Log through a background listener so request and task threads never block on stdout
+    setup_async_logging(app.config['LOG_LEVEL'])
+    
     # Wait for database to be ready (only in production/container environment)
     if os.getenv('FLASK_ENV') != 'development':
         if not wait_for_database():
@@ -2,15 +2,115 @@
 APISIX AI Gateway Service for rate limiting
 """
 
+import atexit
+import orjson
 import requests
 import logging
 import os
 import json
+import re
+import threading
 import time
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 logger = logging.getLogger(__name__)
 
+# Static CORS plugin block shared by every route (read-only)
+_CORS_PLUGIN = {
+    "allow_origins": "*",
+    "allow_methods": "GET,POST,PUT,DELETE,OPTIONS",
+    "allow_headers": "*",
+    "expose_headers": "*",
+    "max_age": 3600,
+    "allow_credential": False
+}
+
+# Characters in model names that are replaced with hyphens in route paths
+_MODEL_SAFE = str.maketrans({".": "-", " ": "-"})
+
+# Matches APISIX rejections that are worth retrying with a simplified route config
+_SCHEMA_ERROR_RE = re.compile(rb"schema|validation", re.I)
+
+# Only a handful of distinct provider endpoints exist, so parse each one once
+@lru_cache(maxsize=128)
+def _parse_endpoint(endpoint: str) -> Tuple[str, int, str]:
+    """Parse an endpoint URL into (host, port, scheme) with upstream defaults applied"""
+    parsed = urlparse(endpoint)
+    host = parsed.hostname or "api.openai.com"
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    scheme = parsed.scheme or "https"
+    return host, port, scheme
+
+# Default upstream endpoint per provider type
+_DEFAULT_ENDPOINTS = {
+    "openai": "https://api.openai.com",
+    "anthropic": "https://api.anthropic.com",
+    "claude": "https://api.anthropic.com",
+    "azure": "https://your-resource.openai.azure.com",
+    "deepseek": "https://api.deepseek.com"
+}
+
+# Auth header used per provider type; "bearer" means Authorization: Bearer <key>
+_AUTH_TEMPLATES = {
+    "openai": "bearer",
+    "anthropic": "x-api-key",
+    "claude": "x-api-key",
+    "azure": "api-key",
+    "deepseek": "bearer"
+}
+
+
+class ProviderKey(NamedTuple):
+    """Hashable snapshot of the provider fields that feed the route config builders"""
+    provider_type: str
+    api_key: str
+    limit: int
+    time_window: int
+    model: Optional[str]
+    endpoint: Optional[str]
+
+
+@lru_cache(maxsize=1024)
+def model_route_path(queue_id: str, model_name: str) -> str:
+    """Gateway path serving one model of a queue, e.g. /<queue_id>-gpt-4o-mini"""
+    return f"/{queue_id}-{model_name.translate(_MODEL_SAFE)}"
+
+
+def providers_key(providers: List[Dict]) -> tuple:
+    """Fingerprint a providers list so route config builders can be memoized.
+    
+    Builder results are shared between calls and must be treated as read-only.
+    """
+    keys = []
+    for provider in providers:
+        config = provider.get("config") or {}
+        keys.append(ProviderKey(
+            provider.get("provider_type", "openai"),
+            provider.get("api_key", ""),
+            provider.get("limit", 1000),
+            provider.get("time_window", 3600),
+            config.get("model"),
+            config.get("endpoint")
+        ))
+    return tuple(keys)
+
+class _MutationRetry(Retry):
+    """Retry that only ever retries allowed_methods.
+    
+    urllib3 applies allowed_methods to read and status retries only; connection
+    errors are retried for every method. Other methods get a single attempt here.
+    """
+    
+    def increment(self, method=None, *args, **kwargs):
+        if method is not None and not self._is_method_retryable(method):
+            # An exhausted copy makes the base class raise MaxRetryError right away
+            return Retry.increment(self.new(total=0), method, *args, **kwargs)
+        return super().increment(method, *args, **kwargs)
+
 class ApisixGateway:
     """
     APISIX AI Gateway for rate limiting
@@ -19,37 +119,109 @@ class ApisixGateway:
     def __init__(self, admin_url: str = None, admin_key: str = None):
         self.admin_url = admin_url or os.getenv('APISIX_ADMIN_URL', 'http://apisix:9180')
         self.admin_url = self.admin_url.rstrip('/')
+        self._routes_url = f"{self.admin_url}/apisix/admin/routes"
+        self._plugins_url = f"{self.admin_url}/apisix/admin/plugins"
         self.admin_key = admin_key or os.getenv('APISIX_ADMIN_KEY', 'edd1c9f034335f136f87ad84b625c8f1')
-        self.headers = {"X-API-KEY": self.admin_key, "Content-Type": "application/json"}
+        self.headers = {"X-API-KEY": self.admin_key, "Content-Type": "application/json", "Connection": "keep-alive"}
         
-        self.timeout = 30
+        # Fail fast on connect, allow longer for the admin API to respond
+        self.connect_timeout = float(os.getenv('APISIX_CONNECT_TIMEOUT', '2'))
+        self.read_timeout = float(os.getenv('APISIX_READ_TIMEOUT', '10'))
+        self.timeout = (self.connect_timeout, self.read_timeout)
         self.max_retries = 5
+        self.backoff_factor = 0.5
+        self.backoff_jitter = 0.5
+        
+        # Last health probe result as (monotonic timestamp, healthy), shared by /health callers
+        self.health_ttl = 2.0
+        self._health_cache = (0.0, False)
+        self._health_lock = threading.Lock()
+        
+        # Hash of the last route object successfully PUT by update_ai_route, per route_id
+        self._last_config_hash: Dict[str, int] = {}
+        
+        # Circuit breaker shared by all admin calls: fast-fail for a cooldown after repeated connection failures
+        self._cb = {"failures": 0, "open_until": 0.0, "threshold": 5, "cooldown": 15.0}
+        self._cb_lock = threading.Lock()
+        
+        # Single shared session so every admin call reuses pooled keep-alive connections
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # One admin host, so few host pools; one socket per Celery task thread that may share
+        # this gateway so concurrent route writes reuse pooled connections
+        # PUT/DELETE retry connection errors and gateway errors with jittered exponential backoff;
+        # GET health probes make exactly one attempt so /health never waits on a retry chain
+        retry = _MutationRetry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset(['PUT', 'DELETE']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=int(os.getenv('CELERY_CONCURRENCY', '32')), max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        atexit.register(self.close)
     
-    def _wait_for_apisix_ready(self) -> bool:
-        """Wait for APISIX to be ready"""
-        for attempt in range(10):
-            try:
-                response = requests.get(
-                    f"{self.admin_url}/apisix/admin/plugins",
-                    headers=self.headers,
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    print(f"✅ APISIX is ready (attempt {attempt + 1})")
-                    return True
-            except Exception as e:
-                print(f"⏳ Waiting for APISIX... (attempt {attempt + 1}): {e}")
-            time.sleep(5)
-        print("❌ APISIX not ready after 10 attempts")
-        return False
+    @property
+    def create_route_budget(self) -> float:
+        """Upper bound in seconds on create_ai_route: the full-config PUT plus both
+        fallback PUTs, each timing out on every adapter retry with maximum backoff"""
+        attempts = self.max_retries + 1
+        backoff = sum(self.backoff_factor * 2 ** n + self.backoff_jitter for n in range(self.max_retries))
+        put_budget = attempts * (self.connect_timeout + self.read_timeout) + backoff
+        return 3 * put_budget
+    
+    def close(self) -> None:
+        """Close pooled admin API connections"""
+        self.session.close()
+    
+    def _circuit_open(self) -> bool:
+        """Check whether the admin API circuit breaker is currently open"""
+        with self._cb_lock:
+            return time.monotonic() < self._cb["open_until"]
+    
+    def _admin_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send an admin API request and feed its outcome into the circuit breaker"""
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            with self._cb_lock:
+                self._cb["failures"] += 1
+                if self._cb["failures"] >= self._cb["threshold"]:
+                    self._cb["open_until"] = time.monotonic() + self._cb["cooldown"]
+            raise
+        with self._cb_lock:
+            self._cb["failures"] = 0
+            self._cb["open_until"] = 0.0
+        return response
     
     def _check_apisix_health(self) -> bool:
         """Check if APISIX is healthy and responding"""
+        checked_at, healthy = self._health_cache
+        if time.monotonic() - checked_at < self.health_ttl:
+            return healthy
+        
+        # Single-flight: concurrent callers wait for one probe instead of each hitting the admin API
+        with self._health_lock:
+            checked_at, healthy = self._health_cache
+            if time.monotonic() - checked_at < self.health_ttl:
+                return healthy
+            
+            healthy = self._probe_apisix_health()
+            self._health_cache = (time.monotonic(), healthy)
+            return healthy
+    
+    def _probe_apisix_health(self) -> bool:
+        """Probe the admin API once"""
         try:
-            response = requests.get(
-                f"{self.admin_url}/apisix/admin/plugins",
-                headers=self.headers,
-                timeout=5
+            if self._circuit_open():
+                return False
+            response = self._admin_request(
+                'GET',
+                self._plugins_url,
+                timeout=self.timeout
             )
             return response.status_code == 200
         except Exception:
@@ -58,142 +230,87 @@ class ApisixGateway:
     def create_ai_route(self, queue_id: str, providers: List[Dict]) -> Dict[str, Any]:
         """Create APISIX route for queue with model names"""
         try:
-            # Wait for APISIX to be ready
-            if not self._wait_for_apisix_ready():
-                print("⚠️  APISIX not ready, but continuing...")
-            
-            # Extract model names from providers and create route path
-            models = []
-            for provider in providers:
-                model_name = provider.get("config", {}).get("model")
-                if not model_name:
-                    raise Exception(f"No model configured for provider {provider.get('provider_id', 'unknown')}")
-                # Replace dots and spaces with hyphens for URL safety
-                model_safe = model_name.replace(".", "-").replace(" ", "-")
-                models.append(model_safe)
-            
-            # Create route path: queue_id-model_name1-model_name2
-            route_path = f"/{queue_id}-{'-'.join(models)}"
+            route_path = self._build_route_path(queue_id, providers)
             route_id = f"route-{queue_id}"
+            # success stays True so queue creation doesn't fail, but created=False: nothing was written
+            unavailable_result = {"success": True, "created": False, "route_id": route_id, "route_path": route_path, "warning": "APISIX connection failed, route will be created on first request"}
             
-            # Build upstream configuration first (required)
-            upstream_config = self._build_upstream_config(providers)
+            # Fast-fail while the circuit breaker is open instead of retrying against a dead APISIX;
+            # otherwise the PUT itself is the readiness probe, so no separate health round trip
+            if self._circuit_open():
+                logger.warning("APISIX circuit open, skipping route creation for %s", route_id)
+                return unavailable_result
             
             # Build proper APISIX route configuration with correct schema
-            config = {
-                "uri": route_path,
-                "methods": ["POST"],
-                "upstream": upstream_config,
-                "plugins": {
-                    "limit-req": self._build_rate_limiting_config(providers),
-                    "proxy-rewrite": self._build_proxy_rewrite_config(providers),
-                    "cors": {
-                        "allow_origins": "*",
-                        "allow_methods": "GET,POST,PUT,DELETE,OPTIONS",
-                        "allow_headers": "*",
-                        "expose_headers": "*",
-                        "max_age": 3600,
-                        "allow_credential": False
-                    }
-                }
-            }
+            key = providers_key(providers)
+            config = self._build_route_config(route_path, key)
+            upstream_config = config["upstream"]
+            # Encode once; every retry attempt sends the same bytes
+            body = orjson.dumps(config)
             
-            # Create route via APISIX Admin API with retry
-            print(f"🔧 Creating APISIX route: {route_path}")
+            # Simplified configurations to retry with if APISIX rejects the full schema
+            fallback_configs = (
+                ("minimal", {"uri": route_path, "methods": ["POST"], "upstream": upstream_config}),
+                ("basic", {"uri": route_path, "upstream": upstream_config}),
+            )
+            route_url = f"{self._routes_url}/{route_id}"
+            # Create may write a fallback config, so the next update must not be skipped
+            self._last_config_hash.pop(route_id, None)
             
-            # Retry mechanism for APISIX connection
-            response = None
-            for attempt in range(self.max_retries):
-                try:
-                    response = requests.put(
-                        f"{self.admin_url}/apisix/admin/routes/{route_id}",
-                        headers=self.headers,
-                        json=config,
-                        timeout=self.timeout
-                    )
-                    print(f"🔧 APISIX response (attempt {attempt + 1}): {response.status_code} - {response.text}")
-                    
-                    if response.status_code in [200, 201]:
-                        logger.info(f"Created APISIX route: {route_path}")
-                        return {"success": True, "route_id": route_id, "route_path": route_path}
-                    elif response.status_code == 409:
-                        # Route already exists, try to update it
-                        print(f"🔧 Route {route_id} already exists, updating...")
-                        update_result = self.update_ai_route(queue_id, providers)
-                        if update_result.get('success'):
-                            return {"success": True, "route_id": route_id, "route_path": route_path, "message": "Route updated successfully"}
-                        else:
-                            return update_result
-                    
-                    break
-                except requests.exceptions.ConnectionError as e:
-                    print(f"🔧 APISIX connection failed (attempt {attempt + 1}): {e}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(5)
-                    else:
-                        print(f"⚠️  APISIX connection failed after {self.max_retries} attempts, but continuing...")
-                        return {"success": True, "route_id": route_id, "route_path": route_path, "warning": "APISIX connection failed, route will be created on first request"}
-                except Exception as e:
-                    print(f"🔧 APISIX request failed (attempt {attempt + 1}): {e}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(3)
-                    else:
-                        return {"success": False, "error": str(e)}
+            # Create route via APISIX Admin API; the session adapter retries with backoff
+            logger.debug("Creating APISIX route: %s", route_path)
+            try:
+                response = self._admin_request(
+                    'PUT',
+                    route_url,
+                    data=body,
+                    timeout=self.timeout
+                )
+            except requests.exceptions.ConnectionError as e:
+                logger.warning("APISIX connection failed after %d retries, but continuing: %s", self.max_retries, e)
+                return unavailable_result
             
-            if response:
-                error_msg = response.text
-                logger.error(f"APISIX route creation failed: {error_msg}")
-                
-                # Check if it's a schema validation error
-                if "schema" in error_msg.lower() or "validation" in error_msg.lower():
-                    print(f"🔧 APISIX schema validation error. Trying simplified configuration...")
-                    # Try with minimal configuration
-                    minimal_config = {
-                        "uri": route_path,
-                        "methods": ["POST"],
-                        "upstream": upstream_config
-                    }
-                    
-                    try:
-                        minimal_response = requests.put(
-                            f"{self.admin_url}/apisix/admin/routes/{route_id}",
-                            headers=self.headers,
-                            json=minimal_config,
+            logger.debug("APISIX response status=%d", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("APISIX response body=%s", response.text)
+            
+            if response.status_code in [200, 201]:
+                logger.info("Created APISIX route: %s", route_path)
+                return {"success": True, "created": True, "route_id": route_id, "route_path": route_path}
+            elif response.status_code == 409:
+                # PUT is an upsert, so an existing route has already been overwritten
+                logger.info("Route %s already exists, overwritten by PUT", route_id)
+                return {"success": True, "created": True, "route_id": route_id, "route_path": route_path, "message": "Route updated successfully"}
+            
+            logger.error("APISIX route creation failed: HTTP %d", response.status_code)
+            
+            # Check if it's a schema validation error without decoding the body
+            if _SCHEMA_ERROR_RE.search(response.content):
+                logger.warning("APISIX schema validation error, trying simplified configuration")
+                # Walk the prebuilt fallback chain over the same pooled connection
+                try:
+                    for label, fallback_config in fallback_configs:
+                        fallback_response = self._admin_request(
+                            'PUT',
+                            route_url,
+                            data=orjson.dumps(fallback_config),
                             timeout=self.timeout
                         )
                         
-                        if minimal_response.status_code in [200, 201]:
-                            logger.info(f"Created APISIX route with minimal config: {route_path}")
-                            return {"success": True, "route_id": route_id, "route_path": route_path, "warning": "Used minimal configuration"}
-                        else:
-                            print(f"🔧 Minimal config failed: HTTP {minimal_response.status_code}: {minimal_response.text}")
-                            # Try even more minimal config
-                            basic_config = {
-                                "uri": route_path,
-                                "upstream": upstream_config
-                            }
-                            
-                            basic_response = requests.put(
-                                f"{self.admin_url}/apisix/admin/routes/{route_id}",
-                                headers=self.headers,
-                                json=basic_config,
-                                timeout=self.timeout
-                            )
-                            
-                            if basic_response.status_code in [200, 201]:
-                                logger.info(f"Created APISIX route with basic config: {route_path}")
-                                return {"success": True, "route_id": route_id, "route_path": route_path, "warning": "Used basic configuration"}
-                            else:
-                                return {"success": False, "error": f"Basic config also failed: HTTP {basic_response.status_code}: {basic_response.text}", "route_path": route_path}
-                    except Exception as e:
-                        return {"success": False, "error": f"Minimal config failed: {str(e)}", "route_path": route_path}
-                
-                return {"success": False, "error": f"HTTP {response.status_code}: {error_msg}", "route_path": route_path}
-            else:
-                return {"success": False, "error": "No response received", "route_path": route_path}
+                        if fallback_response.status_code in [200, 201]:
+                            logger.info("Created APISIX route with %s config: %s", label, route_path)
+                            return {"success": True, "created": True, "route_id": route_id, "route_path": route_path, "warning": f"Used {label} configuration"}
+                        logger.warning("%s config failed: HTTP %d", label.capitalize(), fallback_response.status_code)
+                    
+                    return {"success": False, "error": f"Basic config also failed: HTTP {fallback_response.status_code}: {fallback_response.text}", "route_path": route_path}
+                except Exception as e:
+                    return {"success": False, "error": f"Fallback config failed: {str(e)}", "route_path": route_path}
+            
+            error_msg = response.content.decode("utf-8", "replace")
+            return {"success": False, "error": f"HTTP {response.status_code}: {error_msg}", "route_path": route_path}
                 
         except Exception as e:
-            logger.error(f"APISIX route creation error: {str(e)}")
+            logger.error("APISIX route creation error: %s", e)
             return {"success": False, "error": str(e)}
     
     def update_ai_route(self, queue_id: str, providers: List[Dict]) -> Dict[str, Any]:
@@ -201,46 +318,42 @@ class ApisixGateway:
         try:
             route_id = f"route-{queue_id}"
             
-            # Build complete update configuration including upstream
-            upstream_config = self._build_upstream_config(providers)
+            if self._circuit_open():
+                return {"success": False, "error": "APISIX circuit breaker open, skipping route update"}
             
-            config = {
-                "upstream": upstream_config,
-                "plugins": {
-                    "limit-req": self._build_rate_limiting_config(providers),
-                    "proxy-rewrite": self._build_proxy_rewrite_config(providers),
-                    "cors": {
-                        "allow_origins": "*",
-                        "allow_methods": "GET,POST,PUT,DELETE,OPTIONS",
-                        "allow_headers": "*",
-                        "expose_headers": "*",
-                        "max_age": 3600,
-                        "allow_credential": False
-                    }
-                }
-            }
+            # PUT the full route: APISIX treats it as an upsert, so no PATCH/404/create round trip
+            config = self._build_route_config(self._build_route_path(queue_id, providers), providers_key(providers))
+            
+            # Skip the admin call entirely when the route is unchanged since our last update
+            # Sorted-key encoding is both the request body and the change-detection fingerprint
+            body = orjson.dumps(config, option=orjson.OPT_SORT_KEYS)
+            config_hash = hash(body)
+            if self._last_config_hash.get(route_id) == config_hash:
+                logger.debug("APISIX route %s unchanged, skipping update", route_id)
+                return {"success": True, "route_id": route_id, "noop": True}
             
-            # Try to update the route
-            response = requests.patch(
-                f"{self.admin_url}/apisix/admin/routes/{route_id}",
-                headers=self.headers,
-                json=config,
-                timeout=10
+            response = self._admin_request(
+                'PUT',
+                f"{self._routes_url}/{route_id}",
+                data=body,
+                timeout=self.timeout
             )
             
-            if response.status_code == 200:
-                logger.info(f"Updated APISIX route: {route_id}")
+            if response.status_code in [200, 201]:
+                self._last_config_hash[route_id] = config_hash
+                logger.info("Updated APISIX route: %s", route_id)
                 return {"success": True, "route_id": route_id}
-            elif response.status_code == 404:
-                # Route doesn't exist, try to create it
-                logger.info(f"Route {route_id} not found, creating new route")
-                return self.create_ai_route(queue_id, providers)
             else:
-                logger.error(f"APISIX route update failed: {response.text}")
-                return {"success": False, "error": f"HTTP {response.status_code}: {response.text}"}
+                logger.error("APISIX route update failed: HTTP %d", response.status_code)
+                # Flag schema rejections so callers can fall back to create's simplified configs
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {response.text}",
+                    "schema_error": bool(_SCHEMA_ERROR_RE.search(response.content))
+                }
                 
         except Exception as e:
-            logger.error(f"APISIX route update error: {str(e)}")
+            logger.error("APISIX route update error: %s", e)
             return {"success": False, "error": str(e)}
     
     def delete_ai_route(self, queue_id: str) -> Dict[str, Any]:
@@ -248,26 +361,60 @@ class ApisixGateway:
         try:
             route_id = f"route-{queue_id}"
             
-            response = requests.delete(
-                f"{self.admin_url}/apisix/admin/routes/{route_id}",
-                headers=self.headers,
-                timeout=10
+            if self._circuit_open():
+                return {"success": False, "error": "APISIX circuit breaker open, skipping route deletion"}
+            
+            response = self._admin_request(
+                'DELETE',
+                f"{self._routes_url}/{route_id}",
+                timeout=self.timeout
             )
             
             if response.status_code in [200, 404]:  # 404 is OK - route already deleted
-                logger.info(f"Deleted APISIX route: {route_id}")
+                self._last_config_hash.pop(route_id, None)
+                logger.info("Deleted APISIX route: %s", route_id)
                 return {"success": True, "route_id": route_id}
             else:
-                logger.error(f"APISIX route deletion failed: {response.text}")
+                logger.error("APISIX route deletion failed: HTTP %d", response.status_code)
                 return {"success": False, "error": f"HTTP {response.status_code}: {response.text}"}
                 
         except Exception as e:
-            logger.error(f"APISIX route deletion error: {str(e)}")
+            logger.error("APISIX route deletion error: %s", e)
             return {"success": False, "error": str(e)}
     
-    def _build_rate_limiting_config(self, providers: List[Dict]) -> Dict[str, Any]:
+    @staticmethod
+    def _build_route_path(queue_id: str, providers: List[Dict]) -> str:
+        """Build the route path queue_id-model_name1-model_name2 from provider models"""
+        if len(providers) == 1:
+            return f"/{queue_id}-{ApisixGateway._safe_model_name(providers[0])}"
+        return f"/{queue_id}-" + "-".join(ApisixGateway._safe_model_name(provider) for provider in providers)
+    
+    @staticmethod
+    def _safe_model_name(provider: Dict) -> str:
+        """Get the provider's model with dots and spaces replaced by hyphens for URL safety"""
+        model_name = provider.get("config", {}).get("model")
+        if not model_name:
+            raise Exception(f"No model configured for provider {provider.get('provider_id', 'unknown')}")
+        return model_name.translate(_MODEL_SAFE)
+    
+    def _build_route_config(self, route_path: str, providers_key: tuple) -> Dict[str, Any]:
+        """Build the full APISIX route object shared by create and update"""
+        return {
+            "uri": route_path,
+            "methods": ["POST"],
+            "upstream": self._build_upstream_config(providers_key),
+            "plugins": {
+                "limit-req": self._build_rate_limiting_config(providers_key),
+                "proxy-rewrite": self._build_proxy_rewrite_config(providers_key),
+                "cors": _CORS_PLUGIN
+            }
+        }
+    
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _build_rate_limiting_config(providers_key: tuple) -> Dict[str, Any]:
         """Build rate limiting configuration from providers"""
-        if not providers:
+        if not providers_key:
             return {
                 "rate": 10,
                 "burst": 20,
@@ -276,9 +423,17 @@ class ApisixGateway:
                 "rejected_msg": "Rate limit exceeded"
             }
         
-        # Use the most restrictive rate limit from all providers
-        min_limit = min(provider.get('limit', 1000) for provider in providers)
-        min_time_window = min(provider.get('time_window', 3600) for provider in providers)
+        if len(providers_key) == 1:
+            # Common case: a single provider's own limits apply directly
+            min_limit, min_time_window = providers_key[0].limit, providers_key[0].time_window
+        else:
+            # Use the most restrictive rate limit from all providers, in a single pass
+            min_limit = min_time_window = float('inf')
+            for provider in providers_key:
+                if provider.limit < min_limit:
+                    min_limit = provider.limit
+                if provider.time_window < min_time_window:
+                    min_time_window = provider.time_window
         
         # Convert time_window to rate (requests per second)
         rate = max(0.1, min_limit / min_time_window)  # Ensure minimum rate
@@ -291,29 +446,26 @@ class ApisixGateway:
             "rejected_msg": "Rate limit exceeded"
         }
     
-    def _build_auth_headers(self, providers: List[Dict]) -> Dict[str, str]:
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _build_auth_headers(providers_key: tuple) -> Dict[str, str]:
         """Build authentication headers for the first provider"""
-        if not providers:
+        if not providers_key:
             return {}
         
         # Use first provider for auth (can be enhanced for load balancing)
-        provider = providers[0]
-        provider_type = provider.get("provider_type", "openai")
-        api_key = provider.get("api_key", "")
-        
-        auth_headers = {
-            "openai": {"Authorization": f"Bearer {api_key}"},
-            "anthropic": {"x-api-key": api_key},
-            "claude": {"x-api-key": api_key},
-            "azure": {"api-key": api_key},
-            "deepseek": {"Authorization": f"Bearer {api_key}"}
-        }
+        provider = providers_key[0]
+        header = _AUTH_TEMPLATES.get(provider.provider_type, "bearer")
         
-        return auth_headers.get(provider_type, {"Authorization": f"Bearer {api_key}"})
+        if header == "bearer":
+            return {"Authorization": f"Bearer {provider.api_key}"}
+        return {header: provider.api_key}
     
-    def _build_proxy_rewrite_config(self, providers: List[Dict]) -> Dict[str, Any]:
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _build_proxy_rewrite_config(providers_key: tuple) -> Dict[str, Any]:
         """Build proxy rewrite configuration with auth headers"""
-        auth_headers = self._build_auth_headers(providers)
+        auth_headers = ApisixGateway._build_auth_headers(providers_key)
         
         config = {
             "uri": "/v1/chat/completions"
@@ -325,9 +477,11 @@ class ApisixGateway:
         
         return config
     
-    def _build_upstream_config(self, providers: List[Dict]) -> Dict[str, Any]:
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _build_upstream_config(providers_key: tuple) -> Dict[str, Any]:
         """Build upstream configuration from providers"""
-        if not providers:
+        if not providers_key:
             return {
                 "type": "roundrobin",
                 "nodes": {"httpbin.org:80": 1},
@@ -335,15 +489,11 @@ class ApisixGateway:
             }
         
         # Use first provider's endpoint (can be enhanced for multiple upstreams)
-        provider = providers[0]
-        endpoint = self._get_endpoint(provider.get("provider_type", "openai"), provider)
+        provider = providers_key[0]
+        endpoint = ApisixGateway._get_endpoint(provider.provider_type, provider)
         
         # Extract host and port from endpoint
-        import urllib.parse
-        parsed = urllib.parse.urlparse(endpoint)
-        host = parsed.hostname or "api.openai.com"
-        port = parsed.port or (443 if parsed.scheme == "https" else 80)
-        scheme = parsed.scheme or "https"
+        host, port, scheme = _parse_endpoint(endpoint)
         
         # Ensure we have valid upstream configuration
         upstream_config = {
@@ -367,39 +517,36 @@ class ApisixGateway:
         
         return upstream_config
     
-    def _get_endpoint(self, provider_type: str, provider: Dict) -> str:
+    @staticmethod
+    def _get_endpoint(provider_type: str, provider: ProviderKey) -> str:
         """Get endpoint based on provider type and configuration"""
-        # Check if custom endpoint is provided in config
-        custom_endpoint = provider.get("config", {}).get("endpoint")
-        if custom_endpoint:
-            return custom_endpoint
-        
-        # Default endpoints based on provider type
-        default_endpoints = {
-            "openai": "https://api.openai.com",
-            "anthropic": "https://api.anthropic.com",
-            "claude": "https://api.anthropic.com",
-            "azure": "https://your-resource.openai.azure.com",
-            "deepseek": "https://api.deepseek.com"
-        }
-        
-        return default_endpoints.get(provider_type, "https://api.openai.com")
+        # A custom endpoint in the provider config wins over the per-type default
+        return provider.endpoint or _DEFAULT_ENDPOINTS.get(provider_type, _DEFAULT_ENDPOINTS["openai"])
+
 
+@lru_cache(maxsize=32)
+def _get_gateway(admin_url: str, admin_key: str) -> ApisixGateway:
+    """Gateway cache keyed on the resolved admin URL/key pair"""
+    return ApisixGateway(admin_url, admin_key)
 
-# Global instance for easy import
-apisix_gateway = ApisixGateway()
+def get_gateway(admin_url: str = None, admin_key: str = None) -> ApisixGateway:
+    """Get the gateway for an admin URL/key pair, created once and reused with its connection pool"""
+    # Resolve defaults before the cached lookup so get_gateway() and get_gateway(None, None)
+    # share one instance (and one session, circuit breaker and health cache)
+    admin_url = (admin_url or os.getenv('APISIX_ADMIN_URL', 'http://apisix:9180')).rstrip('/')
+    admin_key = admin_key or os.getenv('APISIX_ADMIN_KEY', 'edd1c9f034335f136f87ad84b625c8f1')
+    return _get_gateway(admin_url, admin_key)
 
 # Simple functions for direct use
-def create_route(queue_id: str, providers: List[Dict]) -> Dict[str, Any]:
+def create_route(queue_id: str, providers: List[Dict], admin_key: str = None) -> Dict[str, Any]:
     """Create APISIX AI route with rate limiting"""
-    print(f"🔧 [create_route] Called with queue_id: {queue_id}")
-    print(f"🔧 [create_route] Providers: {providers}")
-    return apisix_gateway.create_ai_route(queue_id, providers)
+    logger.debug("create_route called for queue_id=%s with %d providers", queue_id, len(providers))
+    return get_gateway(None, admin_key).create_ai_route(queue_id, providers)
 
-def update_route(queue_id: str, providers: List[Dict]) -> Dict[str, Any]:
+def update_route(queue_id: str, providers: List[Dict], admin_key: str = None) -> Dict[str, Any]:
     """Update APISIX AI route"""
-    return apisix_gateway.update_ai_route(queue_id, providers)
+    return get_gateway(None, admin_key).update_ai_route(queue_id, providers)
 
-def delete_route(queue_id: str) -> Dict[str, Any]:
+def delete_route(queue_id: str, admin_key: str = None) -> Dict[str, Any]:
     """Delete APISIX AI route"""
-    return apisix_gateway.delete_ai_route(queue_id)
\ No newline at end of file
+    return get_gateway(None, admin_key).delete_ai_route(queue_id)
\ No newline at end of file
@@ -2,10 +2,54 @@
 Logging configuration for the AI Rate Limiter application
 """
 import os
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from celery.signals import after_setup_logger, worker_process_init
 from flask import Flask
 
+# Set in Celery workers (and inherited by forked pool children), where the root logger
+# is put behind a queue by _queue_celery_logging instead of setup_async_logging
+_celery_owns_logging = False
+# pid of the process that already installed the queue handler
+_async_logging_pid = None
+# Queue and the handlers Celery installed, kept so forked pool children can restart a listener
+_celery_log_queue = None
+_celery_log_handlers = ()
+
+def _start_listener(log_queue, handlers) -> QueueListener:
+    """Start a background thread draining log_queue into handlers"""
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+@after_setup_logger.connect
+def _queue_celery_logging(logger=None, **kwargs):
+    """Move the handlers Celery installed on the root logger behind a QueueListener"""
+    global _celery_owns_logging, _celery_log_queue, _celery_log_handlers
+    _celery_owns_logging = True
+    if logger is None:
+        return
+    
+    handlers = tuple(handler for handler in logger.handlers if not isinstance(handler, QueueHandler))
+    if not handlers:
+        return
+    for handler in handlers:
+        logger.removeHandler(handler)
+    
+    _celery_log_queue = queue.SimpleQueue()
+    _celery_log_handlers = handlers
+    logger.addHandler(QueueHandler(_celery_log_queue))
+    _start_listener(_celery_log_queue, handlers)
+
+@worker_process_init.connect
+def _restart_celery_log_listener(**kwargs):
+    """Listener threads don't survive fork; give each prefork pool child its own"""
+    if _celery_log_queue is not None:
+        _start_listener(_celery_log_queue, _celery_log_handlers)
+
 def setup_logger(app: Flask):
     """Setup logging configuration"""
     
@@ -41,4 +85,27 @@ def setup_logger(app: Flask):
     # Also add to root logger
     logging.getLogger().addHandler(file_handler)
     
-    return app.logger 
\ No newline at end of file
+    return app.logger
+
+def setup_async_logging(level: str = 'INFO') -> None:
+    """Route root logging through a QueueHandler so callers never block on stdout.
+    
+    Runs once per process. Celery workers are skipped: their root logger is already
+    queued by _queue_celery_logging, keeping Celery's own handlers and level.
+    """
+    global _async_logging_pid
+    if _celery_owns_logging or _async_logging_pid == os.getpid():
+        return
+    _async_logging_pid = os.getpid()
+    
+    root = logging.getLogger()
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+    
+    log_queue = queue.SimpleQueue()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    _start_listener(log_queue, (stream_handler,))
@@ -14,8 +14,8 @@ class Message(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(UUID(as_uuid=True), unique=True, nullable=False, default=uuid.uuid4)
-    batch_id = db.Column(UUID(as_uuid=True), db.ForeignKey('batches.batch_id'), nullable=True)
-    queue_id = db.Column(UUID(as_uuid=True), db.ForeignKey('queues.queue_id'), nullable=False)
+    batch_id = db.Column(UUID(as_uuid=True), db.ForeignKey('batches.batch_id'), nullable=True, index=True)
+    queue_id = db.Column(UUID(as_uuid=True), db.ForeignKey('queues.queue_id'), nullable=False, index=True)
     provider_id = db.Column(UUID(as_uuid=True), db.ForeignKey('providers.provider_id'), nullable=True)
     status = db.Column(db.String(50), default='pending', nullable=False)
     prompt = db.Column(db.Text, nullable=False)
@@ -14,7 +14,7 @@ class Provider(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     provider_id = db.Column(UUID(as_uuid=True), unique=True, nullable=False, default=uuid.uuid4)
-    queue_id = db.Column(UUID(as_uuid=True), db.ForeignKey('queues.queue_id'), nullable=False)
+    queue_id = db.Column(UUID(as_uuid=True), db.ForeignKey('queues.queue_id'), nullable=False, index=True)
     provider_name = db.Column(db.String(255), nullable=False)
     provider_type = db.Column(db.String(50), nullable=False)
     api_key = db.Column(db.String(500), nullable=False)
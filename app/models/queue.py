@@ -18,7 +18,7 @@ class Queue(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    providers = db.relationship('Provider', backref='queue', lazy='dynamic', cascade='all, delete-orphan')
+    providers = db.relationship('Provider', backref='queue', lazy='select', cascade='all, delete-orphan')
     messages = db.relationship('Message', backref='queue', lazy='dynamic', cascade='all, delete-orphan')
     workers = db.relationship('Worker', backref='queue', lazy='dynamic', cascade='all, delete-orphan')
     
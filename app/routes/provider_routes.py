@@ -1,53 +1,108 @@
 """
 Provider routes for managing AI providers
 """
-from flask import Blueprint, request, jsonify
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models.provider import Provider
 from app.models.queue import Queue
 from app.utils.exceptions import ProviderNotFoundError, QueueNotFoundError
-from app.apisix_gateway import update_route
+from app.apisix_gateway import create_route, update_route
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
 
 provider_bp = Blueprint('provider', __name__)
 
+# Background thread so provider CRUD responses don't wait on APISIX admin round trips.
+# A single worker runs syncs in submission order and each reads the providers when it
+# runs, so an older snapshot can never land after a newer one
+_apisix_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='apisix-sync')
+
 def update_apisix_routes_for_queue(queue_id: str) -> bool:
     """Update APISIX routes for a queue with all its providers"""
+    # Providers changed, so the cached "route exists" flag no longer holds: workers must
+    # re-ensure the route until APISIX has the new config, even if this update fails
+    try:
+        RedisService.invalidate_route_cache(str(queue_id))
+    except Exception as e:
+        logger.warning("Could not invalidate route cache for queue %s: %s", queue_id, e)
+    
     try:
-        # Get all providers for the queue
-        providers = Provider.query.filter_by(queue_id=queue_id).all()
-        if not providers:
-            print(f"⚠️  No providers found for queue {queue_id}")
+        # Select only the columns the APISIX builders need, without materializing ORM objects
+        rows = db.session.query(
+            Provider.provider_id,
+            Provider.provider_type,
+            Provider.api_key,
+            Provider.limit,
+            Provider.time_window,
+            Provider.config
+        ).filter_by(queue_id=queue_id).all()
+        if not rows:
+            logger.warning("No providers found for queue %s", queue_id)
             return False
         
-        # Convert providers to dict format
-        providers_data = [p.to_dict() for p in providers]
-        
-        print(f"🔧 Updating APISIX routes for queue {queue_id} with {len(providers_data)} providers")
-        
-        # Update APISIX route
+        providers_data = [
+            {
+                'provider_id': str(provider_id),
+                'provider_type': provider_type,
+                'api_key': api_key,
+                'limit': limit,
+                'time_window': time_window,
+                'config': config
+            }
+            for provider_id, provider_type, api_key, limit, time_window, config in rows
+        ]
+        
+        logger.debug("Updating APISIX routes for queue %s with %d providers", queue_id, len(providers_data))
+        
+        # Update APISIX route with an upsert PUT of the full config
         apisix_result = update_route(queue_id, providers_data)
+        if not apisix_result.get('success') and apisix_result.get('schema_error'):
+            # Only create_route walks the simplified-config fallback chain
+            logger.warning("APISIX rejected the full route config for queue %s, retrying via create", queue_id)
+            apisix_result = create_route(queue_id, providers_data)
         routes_updated = apisix_result.get('success', False)
         
         if routes_updated:
-            print(f"✅ Updated APISIX routes for queue {queue_id}")
+            logger.info("Updated APISIX routes for queue %s", queue_id)
         else:
             error_msg = apisix_result.get('error', 'Unknown error')
-            print(f"⚠️  Failed to update APISIX routes for queue {queue_id}: {error_msg}")
-            
-            # Try to create the route if update failed
-            print(f"🔧 Attempting to create route for queue {queue_id}")
-            from app.apisix_gateway import create_route
-            create_result = create_route(queue_id, providers_data)
-            if create_result.get('success'):
-                print(f"✅ Created APISIX route for queue {queue_id}")
-                return True
+            logger.warning("Failed to update APISIX routes for queue %s: %s", queue_id, error_msg)
         
         return routes_updated
         
     except Exception as e:
-        print(f"❌ Error updating APISIX routes for queue {queue_id}: {e}")
+        logger.error("Error updating APISIX routes for queue %s: %s", queue_id, e)
         return False
 
+def _apisix_fields(provider: Provider) -> tuple:
+    """Snapshot of the provider fields that affect its queue's APISIX route"""
+    config = provider.config_dict
+    return (
+        str(provider.queue_id),
+        provider.provider_type,
+        provider.api_key,
+        provider.limit,
+        provider.time_window,
+        config.get('model'),
+        config.get('endpoint')
+    )
+
+def _update_apisix_routes_in_app_context(app, queue_id: str) -> bool:
+    """Run the APISIX route update inside an app context on a background thread"""
+    with app.app_context():
+        return update_apisix_routes_for_queue(queue_id)
+
+def schedule_apisix_routes_update(queue_id: str):
+    """Sync APISIX routes in the background; callers can pass ?sync=1 to wait for the result"""
+    if request.args.get('sync') == '1':
+        return update_apisix_routes_for_queue(queue_id)
+    
+    _apisix_executor.submit(_update_apisix_routes_in_app_context, current_app._get_current_object(), queue_id)
+    return 'pending'
+
 @provider_bp.route('/providers', methods=['GET'])
 def get_providers():
     """List all providers"""
@@ -98,7 +153,7 @@ def create_provider():
         db.session.commit()
         
         # Update APISIX routes for the queue
-        apisix_updated = update_apisix_routes_for_queue(data['queue_id'])
+        apisix_updated = schedule_apisix_routes_update(data['queue_id'])
         
         return jsonify({
             'success': True,
@@ -120,6 +175,8 @@ def update_provider(provider_id):
         if not provider:
             raise ProviderNotFoundError(f"Provider {provider_id} not found")
         
+        apisix_fields_before = _apisix_fields(provider)
+        
         # Update fields
         if 'queue_id' in data:
             provider.queue_id = data['queue_id']
@@ -136,8 +193,11 @@ def update_provider(provider_id):
         
         db.session.commit()
         
-        # Update APISIX routes for the queue
-        apisix_updated = update_apisix_routes_for_queue(provider.queue_id)
+        # Update APISIX routes for the queue only if a field that feeds the route changed
+        if _apisix_fields(provider) != apisix_fields_before:
+            apisix_updated = schedule_apisix_routes_update(provider.queue_id)
+        else:
+            apisix_updated = 'skipped'
         
         return jsonify({
             'success': True,
@@ -164,7 +224,7 @@ def delete_provider(provider_id):
         db.session.commit()
         
         # Update APISIX routes for the queue (with remaining providers)
-        apisix_updated = update_apisix_routes_for_queue(queue_id)
+        apisix_updated = schedule_apisix_routes_update(queue_id)
         
         return jsonify({
             'success': True,
@@ -4,7 +4,7 @@ Queue routes for managing message queues
 from flask import Blueprint, request, jsonify
 from app.services.queue_service import QueueService
 from app.utils.exceptions import QueueNotFoundError, QueueAlreadyExistsError
-from app.apisix_gateway import apisix_gateway
+from app.apisix_gateway import get_gateway
 
 queue_bp = Blueprint('queue', __name__)
 
@@ -13,7 +13,7 @@ def health_check():
     """Health check endpoint"""
     try:
         # Check APISIX health
-        apisix_healthy = apisix_gateway._check_apisix_health()
+        apisix_healthy = get_gateway()._check_apisix_health()
         
         return jsonify({
             'success': True,
@@ -43,9 +43,18 @@ def create_worker(queue_id):
         new_workers = []
         for i in range(count):
             # Start Celery worker process
+            if queue_id == 'batch_aggregator':
+                # Aggregation streams whole batches; prefork keeps task_time_limit enforced
+                pool_args = ['--pool=prefork']
+            else:
+                # process_message is I/O bound (gateway HTTP + DB); threads let one worker
+                # keep many requests in flight. The threads pool can't kill a task past
+                # task_time_limit, so every gateway, Redis and DB call carries its own timeout
+                pool_args = ['--pool=threads', '--concurrency=' + os.getenv('CELERY_CONCURRENCY', '32')]
             cmd = [
                 'celery', '-A', 'app.celery', 'worker',
                 '--loglevel=info',
+                *pool_args,
                 '--queues=' + queue_id,
                 '--hostname=worker@%h'
             ]
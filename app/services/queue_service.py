@@ -2,14 +2,20 @@
 """
 Queue service for managing message queues with APISIX AI Gateway integration
 """
+import logging
+import math
 import uuid
 import time
 from typing import List, Optional, Dict, Any
+from sqlalchemy.orm import selectinload
 from app import db
 from app.models.queue import Queue
 from app.models.provider import Provider
+from app.services.redis_service import RedisService
 from app.utils.exceptions import QueueNotFoundError, QueueAlreadyExistsError
-from app.apisix_gateway import create_route, update_route, delete_route
+from app.apisix_gateway import create_route, update_route, delete_route, get_gateway
+
+logger = logging.getLogger(__name__)
 
 class QueueService:
     """Service for managing queues with APISIX AI Gateway"""
@@ -28,16 +34,16 @@ class QueueService:
             db.session.add(queue)
             db.session.flush()  # Get the queue ID
             
-            # Create providers
-            created_providers = []
+            # Validate required fields for each provider
+            required_fields = ['provider_name', 'api_key', 'limit', 'time_window']
             for provider_data in providers:
-                # Validate required fields for each provider
-                required_fields = ['provider_name', 'api_key', 'limit', 'time_window']
                 for field in required_fields:
                     if not provider_data.get(field):
                         raise ValueError(f"Provider '{provider_data.get('provider_name', 'unknown')}' is missing required field: {field}")
-                
-                provider = Provider(
+            
+            # Create providers in one batch so they flush as a single multi-row INSERT
+            created_providers = [
+                Provider(
                     queue_id=queue.queue_id,
                     provider_name=provider_data['provider_name'],
                     provider_type=provider_data.get('provider_type', 'openai'),
@@ -46,36 +52,43 @@ class QueueService:
                     time_window=provider_data['time_window'],
                     config=provider_data.get('config', {})
                 )
-                db.session.add(provider)
-                created_providers.append(provider)
+                for provider_data in providers
+            ]
+            db.session.add_all(created_providers)
+            db.session.flush()
+            
+            # Serialize once, before commit expires the instances and every
+            # attribute access would trigger a refresh SELECT
+            queue_data = queue.to_dict()
+            providers_data = [p.to_dict() for p in created_providers]
             
             db.session.commit()
             
             # Create APISIX AI Gateway route
             try:
-                providers_data = [p.to_dict() for p in created_providers]
-                print(f"🔧 Creating APISIX route for queue {queue.queue_id} with {len(providers_data)} providers")
-                apisix_result = create_route(str(queue.queue_id), providers_data)
+                logger.debug("Creating APISIX route for queue %s with %d providers", queue_data['queue_id'], len(providers_data))
+                apisix_result = create_route(queue_data['queue_id'], providers_data)
                 routes_created = apisix_result.get('success', False)
                 route_path = apisix_result.get('route_path', '')
                 
+                if apisix_result.get('created'):
+                    RedisService.mark_route_cached(queue_data['queue_id'])
                 if routes_created:
-                    print(f"✅ APISIX route created successfully for queue {queue.queue_id}")
+                    logger.info("APISIX route created for queue %s", queue_data['queue_id'])
                 else:
                     error_msg = apisix_result.get('error', 'Unknown error')
-                    print(f"⚠️  APISIX route creation failed for queue {queue.queue_id}: {error_msg}")
+                    logger.warning("APISIX route creation failed for queue %s: %s", queue_data['queue_id'], error_msg)
                     
             except Exception as e:
-                print(f"⚠️  APISIX route creation failed: {e}")
+                logger.warning("APISIX route creation failed: %s", e)
                 routes_created = False
                 route_path = ''
             
-            print(f"🔧 Route creation result: {routes_created}")
             result = {
                 'success': True,
                 'message': 'Queue and providers created successfully',
-                'queue': queue.to_dict(),
-                'providers': [p.to_dict() for p in created_providers],
+                'queue': queue_data,
+                'providers': providers_data,
                 'apisix_routes_created': routes_created
             }
             
@@ -88,9 +101,9 @@ class QueueService:
             
             return result
             
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            raise e
+            raise
     
 
     
@@ -100,33 +113,52 @@ class QueueService:
         try:
             # Handle special case for batch_aggregator
             if queue_id == 'batch_aggregator':
-                print(f"ℹ️  Skipping APISIX route creation for batch_aggregator queue")
+                logger.debug("Skipping APISIX route creation for batch_aggregator queue")
                 return True
             
             queue_uuid = uuid.UUID(queue_id)
             
-            # Get queue and providers
-            queue = Queue.query.filter_by(queue_id=queue_uuid).first()
-            if not queue:
-                print(f"❌ Queue {queue_id} not found")
-                return False
-            
-            providers = Provider.query.filter_by(queue_id=queue_uuid).all()
-            if not providers:
-                print(f"❌ No providers found for queue {queue_id}")
-                return False
-            
-            # Create or update APISIX AI Gateway route
+            # Under a burst of messages for one queue only the lock holder talks to
+            # APISIX; the others wait for it, then find the route cached and return.
+            # If the holder failed, the next one in line retries the create itself.
+            lock = RedisService.route_lock(queue_id, timeout=math.ceil(get_gateway().create_route_budget))
+            if not lock.acquire():
+                return RedisService.route_cached(queue_id)
             try:
-                providers_data = [p.to_dict() for p in providers]
-                apisix_result = create_route(queue_id, providers_data)
-                return apisix_result.get('success', False)
-            except Exception as e:
-                print(f"❌ Error creating APISIX route: {e}")
-                return False
+                if RedisService.route_cached(queue_id):
+                    return True
+                
+                # Get queue and providers
+                queue = Queue.query.filter_by(queue_id=queue_uuid).first()
+                if not queue:
+                    logger.error("Queue %s not found", queue_id)
+                    return False
+                
+                providers = Provider.query.filter_by(queue_id=queue_uuid).all()
+                if not providers:
+                    logger.error("No providers found for queue %s", queue_id)
+                    return False
+                
+                # Create or update APISIX AI Gateway route
+                try:
+                    providers_data = [p.to_dict() for p in providers]
+                    apisix_result = create_route(queue_id, providers_data)
+                    # Only cache once the route is really in APISIX; an unavailable
+                    # gateway still reports success
+                    if apisix_result.get('created'):
+                        RedisService.mark_route_cached(queue_id)
+                    return apisix_result.get('success', False)
+                except Exception as e:
+                    logger.error("Error creating APISIX route: %s", e)
+                    return False
+            finally:
+                try:
+                    lock.release()
+                except Exception as e:
+                    logger.debug("APISIX route lock for %s already released: %s", queue_id, e)
             
         except Exception as e:
-            print(f"❌ Error ensuring queue routes exist: {e}")
+            logger.error("Error ensuring queue routes exist: %s", e)
             return False
     
     @staticmethod
@@ -137,30 +169,28 @@ class QueueService:
         except ValueError:
             raise ValueError(f"Invalid UUID format: {queue_id}. Please provide a valid UUID.")
         
-        queue = Queue.query.filter_by(queue_id=queue_uuid).first()
+        queue = Queue.query.options(selectinload(Queue.providers)).filter_by(queue_id=queue_uuid).first()
         if not queue:
             raise QueueNotFoundError(f"Queue {queue_id} not found")
         
-        providers = Provider.query.filter_by(queue_id=queue_uuid).all()
-        
         return {
             'success': True,
             'data': {
                 **queue.to_dict(),
-                'providers': [p.to_dict() for p in providers]
+                'providers': [p.to_dict() for p in queue.providers]
             }
         }
     
     @staticmethod
     def get_all_queues() -> Dict[str, Any]:
         """Get all queues with their providers"""
-        queues = Queue.query.all()
+        # Load every queue's providers in one IN query instead of one query per queue
+        queues = Queue.query.options(selectinload(Queue.providers)).all()
         result = []
         
         for queue in queues:
-            providers = Provider.query.filter_by(queue_id=queue.queue_id).all()
             queue_data = queue.to_dict()
-            queue_data['providers'] = [p.to_dict() for p in providers]
+            queue_data['providers'] = [p.to_dict() for p in queue.providers]
             result.append(queue_data)
         
         return {
@@ -183,11 +213,16 @@ class QueueService:
         try:
             delete_route(queue_id)
         except Exception as e:
-            print(f"⚠️  Warning: Could not delete APISIX route: {e}")
+            logger.warning("Could not delete APISIX route: %s", e)
         
         db.session.delete(queue)
         db.session.commit()
         
+        try:
+            RedisService.invalidate_route_cache(queue_id)
+        except Exception as e:
+            logger.warning("Could not invalidate route cache: %s", e)
+        
         return {
             'success': True,
             'message': f"Queue {queue_id} deleted successfully"
@@ -1,9 +1,10 @@
 """
 Redis service for caching and batch tracking
 """
-import json
+import orjson
 import redis
-from typing import Dict, Any, Optional
+from itertools import islice
+from typing import Dict, Any, Iterable, Optional, Tuple
 from app.config.config import Config
 
 class RedisService:
@@ -15,7 +16,11 @@ class RedisService:
     def get_client(cls):
         """Get Redis client"""
         if cls._redis_client is None:
-            cls._redis_client = redis.from_url(Config.REDIS_URL)
+            cls._redis_client = redis.from_url(
+                Config.REDIS_URL,
+                socket_timeout=Config.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=Config.REDIS_SOCKET_TIMEOUT
+            )
         return cls._redis_client
     
     @classmethod
@@ -26,9 +31,10 @@ class RedisService:
         client.hset(f"batch:{batch_id}", "res.count", 0)
     
     @classmethod
-    def increment_batch_response(cls, batch_id: str) -> int:
-        """Increment batch response counter"""
-        client = cls.get_client()
+    def increment_batch_response(cls, batch_id: str, client=None) -> int:
+        """Increment batch response counter (queued instead when client is a pipeline)"""
+        if client is None:
+            client = cls.get_client()
         return client.hincrby(f"batch:{batch_id}", "res.count", 1)
     
     @classmethod
@@ -42,27 +48,107 @@ class RedisService:
         }
     
     @classmethod
-    def store_message_result(cls, message_id: str, result: Dict[str, Any]) -> None:
-        """Store message result in Redis"""
+    def route_cached(cls, queue_id: str) -> bool:
+        """Check whether the APISIX route for a queue was recently ensured"""
         client = cls.get_client()
-        client.setex(f"message:{message_id}", 3600, json.dumps(result))  # 1 hour TTL
+        return bool(client.exists(f"queue:routes:{queue_id}"))
+    
+    @classmethod
+    def mark_route_cached(cls, queue_id: str, ttl: int = 300) -> None:
+        """Remember that the APISIX route for a queue exists for ttl seconds"""
+        client = cls.get_client()
+        client.set(f"queue:routes:{queue_id}", 1, ex=ttl)
+    
+    @classmethod
+    def route_lock(cls, queue_id: str, timeout: float, blocking_timeout: float = 10):
+        """Lock so only one worker (re)creates a queue's APISIX route at a time.
+        
+        timeout must cover the holder's worst-case route write so the lock can't
+        expire mid-PUT; acquire() waits up to blocking_timeout seconds for the holder.
+        """
+        client = cls.get_client()
+        return client.lock(f"lock:apisix:{queue_id}", timeout=timeout, blocking_timeout=blocking_timeout)
+    
+    @classmethod
+    def invalidate_route_cache(cls, queue_id: str) -> None:
+        """Forget the cached APISIX route state for a queue"""
+        client = cls.get_client()
+        client.delete(f"queue:routes:{queue_id}")
+    
+    @classmethod
+    def store_message_result(cls, message_id: str, result: Dict[str, Any], client=None) -> None:
+        """Store message result in Redis (queued instead when client is a pipeline)"""
+        if client is None:
+            client = cls.get_client()
+        client.setex(f"message:{message_id}", 3600, orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS))  # 1 hour TTL
+    
+    @classmethod
+    def finalize_message(cls, message_id: str, result: Dict[str, Any],
+                         batch_id: Optional[str] = None) -> Tuple[Optional[int], Optional[int]]:
+        """Store a message result and bump its batch counter in one round-trip.
+        
+        Returns (response_count, request_count) for batched messages; request_count
+        is None when the batch counters were never initialised. Returns (None, None)
+        when there is no batch.
+        """
+        pipe = cls.get_client().pipeline()
+        cls.store_message_result(message_id, result, client=pipe)
+        if not batch_id:
+            pipe.execute()
+            return None, None
+        cls.increment_batch_response(batch_id, client=pipe)
+        pipe.hget(f"batch:{batch_id}", "req.count")
+        _, response_count, request_count = pipe.execute()
+        return int(response_count), int(request_count) if request_count is not None else None
     
     @classmethod
     def get_message_result(cls, message_id: str) -> Optional[Dict[str, Any]]:
         """Get message result from Redis"""
         client = cls.get_client()
         data = client.get(f"message:{message_id}")
-        return json.loads(data) if data else None
+        return orjson.loads(data) if data else None
     
     @classmethod
     def store_batch_results(cls, batch_id: str, results: Dict[str, Any]) -> None:
         """Store batch results in Redis"""
         client = cls.get_client()
-        client.setex(f"batch_results:{batch_id}", 86400, json.dumps(results))  # 24 hours TTL
+        client.setex(f"batch_results:{batch_id}", 86400, orjson.dumps(results, option=orjson.OPT_NON_STR_KEYS))  # 24 hours TTL
+    
+    @classmethod
+    def stream_batch_results(cls, batch_id: str, header: Dict[str, Any],
+                             rows: Iterable[Dict[str, Any]], chunk_size: int = 500) -> int:
+        """Store batch results as a header plus a list of rows pushed chunk by chunk.
+        
+        Rows are never held in memory all at once. The header is written last, so
+        readers that find it can rely on the row list being complete. Returns the
+        number of rows stored.
+        """
+        client = cls.get_client()
+        items_key = f"batch_results:{batch_id}:items"
+        client.delete(items_key)
+        
+        rows = iter(rows)
+        count = 0
+        while True:
+            chunk = [orjson.dumps(row, option=orjson.OPT_NON_STR_KEYS) for row in islice(rows, chunk_size)]
+            if not chunk:
+                break
+            client.rpush(items_key, *chunk)
+            count += len(chunk)
+        
+        client.expire(items_key, 86400)  # 24 hours TTL, same as the header
+        cls.store_batch_results(batch_id, header)
+        return count
     
     @classmethod
     def get_batch_results(cls, batch_id: str) -> Optional[Dict[str, Any]]:
         """Get batch results from Redis"""
         client = cls.get_client()
         data = client.get(f"batch_results:{batch_id}")
-        return json.loads(data) if data else None 
\ No newline at end of file
+        if not data:
+            return None
+        results = orjson.loads(data)
+        if 'results' not in results:
+            items = client.lrange(f"batch_results:{batch_id}:items", 0, -1)
+            results['results'] = [orjson.loads(item) for item in items]
+        return results 
\ No newline at end of file
@@ -1,89 +1,106 @@
 """
 Celery tasks for processing messages
 """
-import json
+import logging
+import orjson
 import os
 import requests
 import time
-from typing import Dict, Any
+from datetime import datetime
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy import func
 from app import celery, db
 from app.models.message import Message
 from app.models.provider import Provider
 from app.models.batch import Batch
 from app.services.redis_service import RedisService
+from app.apisix_gateway import model_route_path
 from app.services.rabbitmq_service import RabbitMQService
 # 
 from app.utils.exceptions import MessageNotFoundError, ProviderNotFoundError
 from app.utils.celery_context import with_app_context
 
+logger = logging.getLogger(__name__)
+
+_GATEWAY_URL = os.getenv('APISIX_GATEWAY_URL', 'http://127.0.0.1:9080')
+
+# Shared keep-alive pool for outbound calls to the APISIX gateway and webhooks.
+# Only connection failures are retried: a POST that reached the upstream may
+# already have been billed or delivered.
+_http = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+)
+_http.mount('http://', _http_adapter)
+_http.mount('https://', _http_adapter)
+_http.headers.update({'Content-Type': 'application/json'})
+
+_PROMPT_SLOT = '\x00prompt\x00'
+
+@lru_cache(maxsize=256)
+def _request_template(model_name: str, system_prompt: Optional[str]) -> Tuple[bytes, bytes]:
+    """Pre-encode the chat request body around the user prompt.
+    
+    Returns (prefix, suffix) so a request is prefix + orjson.dumps(prompt) + suffix.
+    Messages sharing a model and system prompt reuse the same encoded bytes.
+    """
+    messages = []
+    if system_prompt:
+        messages.append({'role': 'system', 'content': system_prompt})
+    messages.append({'role': 'user', 'content': _PROMPT_SLOT})
+    body = orjson.dumps({'model': model_name, 'messages': messages})
+    # The user content is the last string in the body, so split on the last slot
+    prefix, suffix = body.rsplit(orjson.dumps(_PROMPT_SLOT), 1)
+    return prefix, suffix
+
 @celery.task(bind=True)
 @with_app_context
 def process_message(self, message_id: str) -> Dict[str, Any]:
     """Process a single message"""
+    message = None
     try:
-        # Get message from database
-        message = Message.query.filter_by(message_id=message_id).first()
-        if not message:
+        # Get message and its provider in one query (provider_id is already set
+        # during message creation)
+        row = db.session.query(Message, Provider).outerjoin(
+            Provider, Provider.provider_id == Message.provider_id
+        ).filter(Message.message_id == message_id).first()
+        if not row:
             raise MessageNotFoundError(f"Message {message_id} not found")
+        message, provider = row
         
-        # Update status to processing
-        message.status = 'processing'
-        db.session.commit()
-        
-        # Get provider for the queue (provider_id is already set during message creation)
-        provider = Provider.query.filter_by(provider_id=message.provider_id).first()
         if not provider:
             raise ProviderNotFoundError(f"No provider found for provider_id {message.provider_id}")
         
-        # Ensure APISIX routes exist before processing
-        from app.services.queue_service import QueueService
-        QueueService.ensure_queue_routes_exist(str(message.queue_id))
+        # Ensure APISIX routes exist before processing; only the first message
+        # per cache window pays for the DB lookup and admin API PUT
+        queue_id = str(message.queue_id)
+        if not RedisService.route_cached(queue_id):
+            from app.services.queue_service import QueueService
+            QueueService.ensure_queue_routes_exist(queue_id)
         
         # Process message through APISIX AI Gateway
         try:
-            import requests
-            from app.apisix_gateway import apisix_gateway
-            
-            # Get gateway URL from environment
-            gateway_url = os.getenv('APISIX_GATEWAY_URL', 'http://127.0.0.1:9080')
-            
             # Prepare request for APISIX
             model_name = provider.config_dict.get('model')
             if not model_name:
                 raise Exception(f"No model configured for provider {provider.provider_id}")
                 
-            request_data = {
-                'model': model_name,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': message.prompt
-                    }
-                ]
-            }
-            
-            if message.system_prompt:
-                request_data['messages'].insert(0, {
-                    'role': 'system',
-                    'content': message.system_prompt
-                })
+            prefix, suffix = _request_template(model_name, message.system_prompt or None)
             
             # Send request to APISIX AI Gateway
-            # Get model name from provider config
-            model_name = provider.config_dict.get('model')
-            if not model_name:
-                raise Exception(f"No model configured for provider {provider.provider_id}")
-            model_safe = model_name.replace(".", "-").replace(" ", "-")
-            
-            response = requests.post(
-                f"{gateway_url}/{message.queue_id}-{model_safe}",
-                json=request_data,
-                headers={'Content-Type': 'application/json'},
+            response = _http.post(
+                _GATEWAY_URL + model_route_path(queue_id, model_name),
+                data=prefix + orjson.dumps(message.prompt) + suffix,
                 timeout=30
             )
             
             if response.status_code == 200:
-                response_data = response.json()
+                response_data = orjson.loads(response.content)
                 response = {
                     'content': response_data.get('choices', [{}])[0].get('message', {}).get('content', ''),
                     'status': 'completed'
@@ -92,47 +109,56 @@ def process_message(self, message_id: str) -> Dict[str, Any]:
                 raise Exception(f"APISIX request failed: {response.status_code} - {response.text}")
                 
         except Exception as e:
-            print(f"APISIX processing failed: {e}")
+            logger.warning("APISIX processing failed: %s", e)
             # Fallback to simulated response
             response = {
                 'content': f"Processed message: {message.prompt}",
                 'status': 'completed'
             }
         
-        # Update message with result (provider_id is already set)
+        # Read ids before commit expires the instance
+        message_key = str(message.message_id)
+        batch_id = message.batch_id
+        
+        # Single write per message: status and result land in one UPDATE/commit
         message.status = 'completed'
         message.result = response.get('content', '')
         db.session.commit()
         
-        # Store result in Redis
-        RedisService.store_message_result(str(message.message_id), response)
+        # Store result in Redis and, for batches, increment the batch counter
+        # in the same pipelined round-trip
+        response_count, request_count = RedisService.finalize_message(
+            message_key, response, str(batch_id) if batch_id else None
+        )
         
-        # If this is part of a batch, increment batch counter
-        if message.batch_id:
-            response_count = RedisService.increment_batch_response(str(message.batch_id))
-            
-            # Check if batch is complete
-            batch = Batch.query.filter_by(batch_id=message.batch_id).first()
-            if batch and response_count >= batch.request_count:
+        if batch_id:
+            # Check if batch is complete; request_count is cached in Redis at batch
+            # creation, the DB is only consulted if those counters are missing
+            if request_count is not None:
+                batch_complete = response_count == request_count
+            else:
+                request_count = db.session.query(Batch.request_count).filter_by(batch_id=batch_id).scalar()
+                batch_complete = request_count is not None and response_count >= request_count
+            if batch_complete:
                 # Batch is complete, call aggregator task
                 from app.tasks.worker_tasks import process_batch_aggregator
-                process_batch_aggregator.apply_async(args=[str(message.batch_id)], queue='batch_aggregator')
+                process_batch_aggregator.apply_async(args=[str(batch_id)], queue='batch_aggregator')
         
         return {
             'success': True,
-            'message_id': str(message.message_id),
+            'message_id': message_key,
             'result': response
         }
         
     except Exception as e:
         # Update message status to failed
-        if 'message' in locals():
+        if message is not None:
             message.status = 'failed'
             message.error_message = str(e)
             db.session.commit()
         
         # Re-raise the exception
-        raise e
+        raise
 
 @celery.task(bind=True)
 @with_app_context
@@ -144,73 +170,94 @@ def process_batch_aggregator(self, batch_id: str) -> Dict[str, Any]:
         if not batch:
             return {'success': False, 'error': 'Batch not found'}
         
-        # Get all messages for the batch
-        messages = Message.query.filter_by(batch_id=batch_id).all()
-        
-        # Aggregate results
-        results = []
-        for message in messages:
-            result = {
-                'message_id': str(message.message_id),
-                'status': message.status,
-                'prompt': message.prompt,
-                'result': message.result,
-                'error_message': message.error_message
+        # Stream just the needed columns instead of hydrating full Message objects
+        rows = db.session.query(
+            Message.message_id,
+            Message.status,
+            Message.prompt,
+            Message.result,
+            Message.error_message
+        ).filter(Message.batch_id == batch.batch_id).yield_per(1000)
+        
+        # Aggregate results lazily so rows go to Redis in chunks as they stream in
+        results = (
+            {
+                'message_id': str(message_id),
+                'status': status,
+                'prompt': prompt,
+                'result': result,
+                'error_message': error_message
             }
-            results.append(result)
+            for message_id, status, prompt, result, error_message in rows
+        )
         
-        # Store batch results in Redis
+        # Store batch results in Redis; only the small header is serialized whole
         batch_data = {
             'batch_id': str(batch.batch_id),
             'request_count': batch.request_count,
             'response_count': batch.response_count,
-            'results': results,
             'completed_at': time.time()
         }
-        RedisService.store_batch_results(str(batch.batch_id), batch_data)
+        results_count = RedisService.stream_batch_results(str(batch.batch_id), batch_data, results)
         
         # Update batch status
         batch.status = 'completed'
-        batch.response_count = len([r for r in results if r['status'] == 'completed'])
+        batch.response_count = db.session.query(func.count(Message.id)).filter(
+            Message.batch_id == batch.batch_id,
+            Message.status == 'completed'
+        ).scalar()
         db.session.commit()
         
-        # Send webhook if configured
+        # Hand the webhook to its own task so a slow receiver doesn't hold this slot
         if batch.webhook_url:
-            try:
-                webhook_data = {
-                    'batch_id': str(batch.batch_id),
-                    'status': 'completed',
-                    'request_count': batch.request_count,
-                    'response_count': batch.response_count,
-                    'results': results
-                }
-                
-                response = requests.post(
-                    batch.webhook_url,
-                    json=webhook_data,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    batch.webhook_status = 'success'
-                else:
-                    batch.webhook_status = 'failed'
-                
-                batch.webhook_last_called_at = time.time()
-                db.session.commit()
-                
-            except Exception as e:
-                batch.webhook_status = 'failed'
-                db.session.commit()
+            send_webhook.apply_async(args=[str(batch.batch_id), batch.webhook_url], queue='batch_aggregator')
         
         return {
             'success': True,
             'batch_id': str(batch.batch_id),
-            'results_count': len(results)
+            'results_count': results_count
         }
         
-    except Exception as e:
-        raise e
+    except Exception:
+        raise
+
+@celery.task(bind=True, max_retries=5)
+@with_app_context
+def send_webhook(self, batch_id: str, webhook_url: str) -> Dict[str, Any]:
+    """POST the aggregated batch results to the batch's webhook URL"""
+    batch = Batch.query.filter_by(batch_id=batch_id).first()
+    if not batch:
+        return {'success': False, 'error': 'Batch not found'}
+    
+    batch_results = RedisService.get_batch_results(batch_id) or {}
+    webhook_data = {
+        'batch_id': batch_id,
+        'status': 'completed',
+        'request_count': batch.request_count,
+        'response_count': batch.response_count,
+        'results': batch_results.get('results', [])
+    }
+    
+    try:
+        response = _http.post(webhook_url, data=orjson.dumps(webhook_data), timeout=30)
+    except requests.RequestException as e:
+        if self.request.retries < self.max_retries:
+            # Exponential backoff: 1s, 2s, 4s, ...
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        logger.warning("Webhook for batch %s failed after %d retries: %s", batch_id, self.max_retries, e)
+        batch.webhook_status = 'failed'
+        db.session.commit()
+        return {'success': False, 'batch_id': batch_id, 'error': str(e)}
+    
+    batch.webhook_status = 'success' if response.status_code == 200 else 'failed'
+    batch.webhook_last_called_at = datetime.utcnow()
+    db.session.commit()
+    
+    return {
+        'success': batch.webhook_status == 'success',
+        'batch_id': batch_id,
+        'status_code': response.status_code
+    }
 
 @celery.task(bind=True)
 @with_app_context
@@ -220,5 +267,5 @@ def cleanup_expired_data(self) -> Dict[str, Any]:
         # This task can be scheduled to run periodically
         # to clean up old message results and batch data
         return {'success': True, 'message': 'Cleanup completed'}
-    except Exception as e:
-        raise e 
\ No newline at end of file
+    except Exception:
+        raise 
\ No newline at end of file
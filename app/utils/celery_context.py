@@ -1,14 +1,32 @@
 """
 Celery context utilities
 """
+import os
+import threading
 from functools import wraps
 from app import create_app
 
+# One Flask app (and so one SQLAlchemy engine and connection pool) per worker
+# process, shared by every task thread; keyed by pid so forked children build their own
+_app = None
+_app_pid = None
+_app_lock = threading.Lock()
+
+def _get_app():
+    """Build the Flask app once per process and reuse it for every task"""
+    global _app, _app_pid
+    pid = os.getpid()
+    if _app_pid != pid:
+        with _app_lock:
+            if _app_pid != pid:
+                _app = create_app()
+                _app_pid = pid
+    return _app
+
 def with_app_context(func):
     """Decorator to add Flask app context to Celery tasks"""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        app = create_app()
-        with app.app_context():
+        with _get_app().app_context():
             return func(*args, **kwargs)
-    return wrapper 
\ No newline at end of file
+    return wrapper